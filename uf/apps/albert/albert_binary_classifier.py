@@ -2,7 +2,7 @@ from .albert import ALBERTEncoder, ALBERTConfig, get_decay_power
 from .._base_._base_binary_classifier import BinaryClsDecoder, BinaryClassifierModule
 from ..bert.bert_binary_classifier import BERTBinaryClassifier
 from ...token import WordPieceTokenizer
-from ...third import tf
+from ... import com
 
 
 class ALBERTBinaryClassifier(BERTBinaryClassifier, BinaryClassifierModule):
@@ -21,6 +21,9 @@ class ALBERTBinaryClassifier(BERTBinaryClassifier, BinaryClassifierModule):
         drop_pooler=False,
         do_lower_case=True,
         truncate_method="LIFO",
+        mixed_precision="fp32",
+        tensor_cores=None,
+        jit_compile=False,
     ):
         self.__init_args__ = locals()
         super(BinaryClassifierModule, self).__init__(init_checkpoint, output_dir, gpu_ids)
@@ -29,20 +32,20 @@ class ALBERTBinaryClassifier(BERTBinaryClassifier, BinaryClassifierModule):
         self.label_size = label_size
         self.label_weight = label_weight
         self.truncate_method = truncate_method
+        self.mixed_precision = mixed_precision
+        self.tensor_cores = tensor_cores
+        self.jit_compile = jit_compile
         self._drop_pooler = drop_pooler
 
+        assert mixed_precision in ("fp32", "bf16"), (
+            "Invalid value of `mixed_precision`: %s. Pick one from "
+            "`fp32` and `bf16`." % mixed_precision
+        )
         self.albert_config = ALBERTConfig.from_json_file(config_file)
         self.tokenizer = WordPieceTokenizer(vocab_file, do_lower_case)
         self.decay_power = get_decay_power(self.albert_config.num_hidden_layers)
 
-        if "[CLS]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[CLS]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[CLS]` into vocabulary.")
-        if "[SEP]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[SEP]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[SEP]` into vocabulary.")
+        com.ensure_special_tokens(self.tokenizer, self.albert_config, ["[CLS]", "[SEP]"])
 
     def _forward(self, is_training, placeholders, **kwargs):
 
@@ -30,6 +30,10 @@ class ALBERTLM(LMModule):
         do_whole_word_mask=True,
         do_lower_case=True,
         truncate_method="LIFO",
+        mixed_precision="fp32",
+        tensor_cores=None,
+        jit_compile=False,
+        use_tensorrt=False,
     ):
         self.__init_args__ = locals()
         super(LMModule, self).__init__(init_checkpoint, output_dir, gpu_ids)
@@ -43,22 +47,24 @@ class ALBERTLM(LMModule):
         self.favor_shorter_ngram = favor_shorterngram
         self.do_whole_word_mask = do_whole_word_mask
         self.truncate_method = truncate_method
+        self.mixed_precision = mixed_precision
+        self.tensor_cores = tensor_cores
+        self.jit_compile = jit_compile
+        self.use_tensorrt = use_tensorrt
         self._drop_pooler = drop_pooler
         self._max_predictions_per_seq = max_predictions_per_seq
         self._do_permutation = do_permutation
+        self._mlm_scratch = None
 
+        assert mixed_precision in ("fp32", "bf16"), (
+            "Invalid value of `mixed_precision`: %s. Pick one from "
+            "`fp32` and `bf16`." % mixed_precision
+        )
         self.albert_config = ALBERTConfig.from_json_file(config_file)
         self.tokenizer = WordPieceTokenizer(vocab_file, do_lower_case)
         self.decay_power = get_decay_power(self.albert_config.num_hidden_layers)
 
-        if "[CLS]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[CLS]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[CLS]` into vocabulary.")
-        if "[SEP]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[SEP]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[SEP]` into vocabulary.")
+        com.ensure_special_tokens(self.tokenizer, self.albert_config, ["[CLS]", "[SEP]"])
 
     def convert(self, X=None, y=None, sample_weight=None, X_tokenized=None, is_training=False, is_parallel=False):
         self._assert_legal(X, y, sample_weight, X_tokenized)
@@ -80,14 +86,14 @@ class ALBERTLM(LMModule):
                 X_tokenized if tokenized else X, is_training, tokenized=tokenized,
             )
 
-            data["input_ids"] = np.array(input_ids, dtype=np.int32)
-            data["input_mask"] = np.array(input_mask, dtype=np.int32)
-            data["segment_ids"] = np.array(segment_ids, dtype=np.int32)
-            data["masked_lm_positions"] = np.array(masked_lm_positions, dtype=np.int32)
+            data["input_ids"] = input_ids
+            data["input_mask"] = input_mask
+            data["segment_ids"] = segment_ids
+            data["masked_lm_positions"] = masked_lm_positions
 
             if is_training:
-                data["masked_lm_ids"] = np.array(masked_lm_ids, dtype=np.int32)
-                data["masked_lm_weights"] = np.array(masked_lm_weights, dtype=np.float32)
+                data["masked_lm_ids"] = masked_lm_ids
+                data["masked_lm_weights"] = masked_lm_weights
 
             if is_training and self.do_sample_sentence:
                 data["sentence_order_labels"] = np.array(sentence_order_labels, dtype=np.int32)
@@ -109,105 +115,112 @@ class ALBERTLM(LMModule):
         return data
 
     def _convert_X(self, X_target, is_training, tokenized):
-
-        # tokenize input texts
-        segment_input_tokens = []
-        for idx, sample in enumerate(X_target):
-            try:
-                segment_input_tokens.append(self._convert_x(sample, tokenized))
-            except Exception as e:
-                raise ValueError("Wrong input format (%s): %s." % (sample, e))
-
-        input_ids = []
-        input_mask = []
-        segment_ids = []
-        masked_lm_positions = []
-        masked_lm_ids = []
-        masked_lm_weights = []
+        vocab_words = self.tokenizer.vocab_words
+
+        # tokenize input texts lazily
+        def iter_tokenized():
+            for sample in X_target:
+                try:
+                    yield self._convert_x(sample, tokenized)
+                except Exception as e:
+                    raise ValueError("Wrong input format (%s): %s." % (sample, e))
+
+        segment_input_tokens = iter_tokenized()
+        n_inputs = len(X_target)
         sentence_order_labels = []
 
-        # random sampling of next sentence
+        # random sampling of next sentence, which requires all the
+        # documents at hand
         if is_training and self.do_sample_sentence:
-            new_segment_input_tokens = []
-            for idx in range(len(segment_input_tokens)):
+            documents = list(segment_input_tokens)
+            segment_input_tokens = []
+            for idx in range(len(documents)):
                 instances = create_instances_from_document(
-                    all_documents=segment_input_tokens,
+                    all_documents=documents,
                     document_index=idx,
                     max_seq_length=self.max_seq_length - 3,
                     masked_lm_prob=self.masked_lm_prob,
                     max_predictions_per_seq=self._max_predictions_per_seq,
                     short_seq_prob=self.short_seq_prob,
-                    vocab_words=list(self.tokenizer.vocab.keys()),
+                    vocab_words=vocab_words,
                 )
                 for (segments, is_random_next) in instances:
-                    new_segment_input_tokens.append(segments)
+                    segment_input_tokens.append(segments)
                     sentence_order_labels.append(is_random_next)
-            segment_input_tokens = new_segment_input_tokens
-
-        for idx, segments in enumerate(segment_input_tokens):
-            _input_tokens = ["[CLS]"]
-            _input_ids = []
-            _input_mask = [1]
-            _segment_ids = [0]
-            _masked_lm_positions = []
-            _masked_lm_ids = []
-            _masked_lm_weights = []
-
-            com.truncate_segments(segments, self.max_seq_length - len(segments) - 1, truncate_method=self.truncate_method)
-
-            for s_id, segment in enumerate(segments):
-                _segment_id = min(s_id, 1)
-                _input_tokens.extend(segment + ["[SEP]"])
-                _input_mask.extend([1] * (len(segment) + 1))
-                _segment_ids.extend([_segment_id] * (len(segment) + 1))
-
-            # random sampling of masked tokens
+            del documents    # instances hold copies of the tokens
+            n_inputs = len(segment_input_tokens)
+
+            # hand the instances over in order, releasing each as it is taken
+            instances = segment_input_tokens
+            instances.reverse()
+            segment_input_tokens = (instances.pop() for _ in range(n_inputs))
+
+        # preallocate zero-padded buffers and fill in the valid spans
+        max_predictions = self._max_predictions_per_seq * (1 + self._do_permutation)
+        input_ids = np.zeros((n_inputs, self.max_seq_length), dtype=np.int32)
+        input_mask = np.zeros((n_inputs, self.max_seq_length), dtype=np.int32)
+        segment_ids = np.zeros((n_inputs, self.max_seq_length), dtype=np.int32)
+        masked_lm_positions = np.zeros((n_inputs, max_predictions), dtype=np.int32)
+        masked_lm_ids = np.zeros((n_inputs, max_predictions), dtype=np.int32)
+        masked_lm_weights = np.zeros((n_inputs, max_predictions), dtype=np.float32)
+
+        # From here on, samples are built, masked and written into the
+        # buffers one by one, so that tokens of only a bounded window of
+        # samples are held in memory at a time. The exception is
+        # sentence-order sampling, whose instances are all formed up front
+        # and are only released one by one as they are written.
+        def iter_input_tokens():
+            for idx, segments in enumerate(segment_input_tokens):
+                com.truncate_segments(segments, self.max_seq_length - len(segments) - 1, truncate_method=self.truncate_method)
+
+                # [CLS] A [SEP] B [SEP] ...
+                _input_tokens = ["[CLS]"]
+                for segment in segments:
+                    _input_tokens.extend(segment)
+                    _input_tokens.append("[SEP]")
+
+                # Masks are ones over all the tokens. Segment ids are zeros
+                # over [CLS] A [SEP] and ones over all the following segments.
+                _seq_length = len(_input_tokens)
+                input_mask[idx, :_seq_length] = 1
+                if len(segments) > 1:
+                    segment_ids[idx, len(segments[0]) + 2:_seq_length] = 1
+
+                yield _input_tokens
+
+        samples = iter_input_tokens()
+
+        # random sampling of masked tokens
+        if is_training:
+            samples = (create_masked_lm_predictions(
+                tokens=_input_tokens,
+                masked_lm_prob=self.masked_lm_prob,
+                max_predictions_per_seq=self._max_predictions_per_seq,
+                vocab_words=vocab_words,
+                ngram=self.ngram,
+                favor_shorterngram=self.favor_shorter_ngram,
+                do_permutation=self._do_permutation,
+                do_whole_word_mask=self.do_whole_word_mask,
+            ) for _input_tokens in samples)
+
+        for idx, sample in enumerate(samples):
             if is_training:
                 if (idx + 1) % 10000 == 0:
                     tf.logging.info("Sampling masks of input %d" % (idx + 1))
-                (_input_tokens, _masked_lm_positions, _masked_lm_labels) = create_masked_lm_predictions(
-                    tokens=_input_tokens,
-                    masked_lm_prob=self.masked_lm_prob,
-                    max_predictions_per_seq=self._max_predictions_per_seq,
-                    vocab_words=list(self.tokenizer.vocab.keys()),
-                    ngram=self.ngram,
-                    favor_shorterngram=self.favor_shorter_ngram,
-                    do_permutation=self._do_permutation,
-                    do_whole_word_mask=self.do_whole_word_mask,
-                )
-                _masked_lm_ids = self.tokenizer.convert_tokens_to_ids(_masked_lm_labels)
-                _masked_lm_weights = [1.0] * len(_masked_lm_positions)
-
-                # padding
-                for _ in range(self._max_predictions_per_seq * (1 + self._do_permutation) - len(_masked_lm_positions)):
-                    _masked_lm_positions.append(0)
-                    _masked_lm_ids.append(0)
-                    _masked_lm_weights.append(0.0)
+                (_input_tokens, _masked_lm_positions, _masked_lm_labels) = sample
+                _n_masked = len(_masked_lm_positions)
+                masked_lm_positions[idx, :_n_masked] = _masked_lm_positions
+                self.tokenizer.convert_tokens_to_ids_np(_masked_lm_labels, out=masked_lm_ids[idx])
+                masked_lm_weights[idx, :_n_masked] = 1.0
             else:
+                _input_tokens = sample
+
                 # `masked_lm_positions` is required for both training
                 # and inference of BERT language modeling.
-                for i in range(len(_input_tokens)):
-                    if _input_tokens[i] == "[MASK]":
-                        _masked_lm_positions.append(i)
-
-                # padding
-                for _ in range(self._max_predictions_per_seq * (1 + self._do_permutation) - len(_masked_lm_positions)):
-                    _masked_lm_positions.append(0)
-
-            _input_ids = self.tokenizer.convert_tokens_to_ids(_input_tokens)
-
-            # padding
-            for _ in range(self.max_seq_length - len(_input_ids)):
-                _input_ids.append(0)
-                _input_mask.append(0)
-                _segment_ids.append(0)
+                _masked_lm_positions = [i for i, _token in enumerate(_input_tokens) if _token == "[MASK]"]
+                masked_lm_positions[idx, :len(_masked_lm_positions)] = _masked_lm_positions
 
-            input_ids.append(_input_ids)
-            input_mask.append(_input_mask)
-            segment_ids.append(_segment_ids)
-            masked_lm_positions.append(_masked_lm_positions)
-            masked_lm_ids.append(_masked_lm_ids)
-            masked_lm_weights.append(_masked_lm_weights)
+            self.tokenizer.convert_tokens_to_ids_np(_input_tokens, out=input_ids[idx])
 
         return (input_ids, input_mask, segment_ids, masked_lm_positions, masked_lm_ids, masked_lm_weights, sentence_order_labels)
 
@@ -269,12 +282,17 @@ class ALBERTLM(LMModule):
 
         # MLM accuracy
         batch_mlm_preds = output_arrays[0]
-        batch_mlm_mask = (batch_mlm_positions > 0)
-        mlm_accuracy = (np.sum((batch_mlm_preds == batch_mlm_labels) * batch_mlm_mask) / batch_mlm_mask.sum())
+        if self._mlm_scratch is None or self._mlm_scratch.shape != batch_mlm_preds.shape:
+            self._mlm_scratch = np.empty(batch_mlm_preds.shape, dtype=bool)
+        np.equal(batch_mlm_preds, batch_mlm_labels, out=self._mlm_scratch)
+        np.logical_and(self._mlm_scratch, batch_mlm_positions, out=self._mlm_scratch)    # padded positions are zeros
+        n_masked = np.count_nonzero(batch_mlm_positions)
+        mlm_accuracy = np.count_nonzero(self._mlm_scratch) / n_masked if n_masked else float("nan")
 
         # SOP accuracy
         batch_sop_preds = output_arrays[1]
-        sop_accuracy = np.mean(batch_sop_preds == batch_sop_labels)
+        n_sop = batch_sop_labels.size
+        sop_accuracy = np.count_nonzero(batch_sop_preds == batch_sop_labels) / n_sop if n_sop else float("nan")
 
         # MLM loss
         batch_mlm_losses = output_arrays[2]
@@ -300,14 +318,10 @@ class ALBERTLM(LMModule):
         # MLM preds
         mlm_preds = []
         mlm_positions = self.data["masked_lm_positions"]
+        valid_lens = np.count_nonzero(mlm_positions[:n_inputs], axis=1)
         all_preds = com.transform(output_arrays[0], n_inputs)
         for idx, _preds in enumerate(all_preds):
-            _ids = []
-            for p_id, _id in enumerate(_preds):
-                if mlm_positions[idx][p_id] == 0:
-                    break
-                _ids.append(_id)
-            mlm_preds.append(self.tokenizer.convert_ids_to_tokens(_ids))
+            mlm_preds.append(self.tokenizer.convert_ids_to_tokens_np(_preds[:valid_lens[idx]]))
 
         # SOP preds
         sop_preds = com.transform(output_arrays[1], n_inputs).tolist()
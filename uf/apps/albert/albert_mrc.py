@@ -2,7 +2,7 @@ from .albert import ALBERTEncoder, ALBERTConfig, get_decay_power
 from ..bert.bert_mrc import BERTMRC
 from .._base_._base_mrc import MRCDecoder, MRCModule
 from ...token import WordPieceTokenizer
-from ...third import tf
+from ... import com
 
 
 class ALBERTMRC(BERTMRC, MRCModule):
@@ -18,26 +18,29 @@ class ALBERTMRC(BERTMRC, MRCModule):
         gpu_ids=None,
         do_lower_case=True,
         truncate_method="longer-FO",
+        mixed_precision="fp32",
+        tensor_cores=None,
+        jit_compile=False,
     ):
         self.__init_args__ = locals()
         super(MRCModule, self).__init__(init_checkpoint, output_dir, gpu_ids)
 
         self.max_seq_length = max_seq_length
         self.truncate_method = truncate_method
+        self.mixed_precision = mixed_precision
+        self.tensor_cores = tensor_cores
+        self.jit_compile = jit_compile
         self._do_lower_case = do_lower_case
 
+        assert mixed_precision in ("fp32", "bf16"), (
+            "Invalid value of `mixed_precision`: %s. Pick one from "
+            "`fp32` and `bf16`." % mixed_precision
+        )
         self.albert_config = ALBERTConfig.from_json_file(config_file)
         self.tokenizer = WordPieceTokenizer(vocab_file, do_lower_case)
         self.decay_power = get_decay_power(self.albert_config.num_hidden_layers)
 
-        if "[CLS]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[CLS]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[CLS]` into vocabulary.")
-        if "[SEP]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[SEP]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[SEP]` into vocabulary.")
+        com.ensure_special_tokens(self.tokenizer, self.albert_config, ["[CLS]", "[SEP]"])
 
     def _forward(self, is_training, placeholders, **kwargs):
 
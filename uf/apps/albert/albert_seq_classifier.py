@@ -1,8 +1,8 @@
-from .albert import ALBERTEncoder, ALBERTConfig,  get_decay_power
+from .albert import ALBERTEncoder, ALBERTConfig, get_decay_power
 from .._base_._base_seq_classifier import SeqClsDecoder, SeqClassifierModule
 from ..bert.bert_seq_classifier import BERTSeqClassifier
 from ...token import WordPieceTokenizer
-from ...third import tf
+from ... import com
 
 
 class ALBERTSeqClassifier(BERTSeqClassifier, SeqClassifierModule):
@@ -19,6 +19,9 @@ class ALBERTSeqClassifier(BERTSeqClassifier, SeqClassifierModule):
         gpu_ids=None,
         do_lower_case=True,
         truncate_method="LIFO",
+        mixed_precision="fp32",
+        tensor_cores=None,
+        jit_compile=False,
     ):
         self.__init_args__ = locals()
         super(SeqClassifierModule, self).__init__(init_checkpoint, output_dir, gpu_ids)
@@ -26,19 +29,19 @@ class ALBERTSeqClassifier(BERTSeqClassifier, SeqClassifierModule):
         self.max_seq_length = max_seq_length
         self.label_size = label_size
         self.truncate_method = truncate_method
+        self.mixed_precision = mixed_precision
+        self.tensor_cores = tensor_cores
+        self.jit_compile = jit_compile
 
+        assert mixed_precision in ("fp32", "bf16"), (
+            "Invalid value of `mixed_precision`: %s. Pick one from "
+            "`fp32` and `bf16`." % mixed_precision
+        )
         self.albert_config = ALBERTConfig.from_json_file(config_file)
         self.tokenizer = WordPieceTokenizer(vocab_file, do_lower_case)
         self.decay_power = get_decay_power(self.albert_config.num_hidden_layers)
 
-        if "[CLS]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[CLS]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[CLS]` into vocabulary.")
-        if "[SEP]" not in self.tokenizer.vocab:
-            self.tokenizer.add("[SEP]")
-            self.albert_config.vocab_size += 1
-            tf.logging.info("Add necessary token `[SEP]` into vocabulary.")
+        com.ensure_special_tokens(self.tokenizer, self.albert_config, ["[CLS]", "[SEP]"])
 
     def _forward(self, is_training, placeholders, **kwargs):
 
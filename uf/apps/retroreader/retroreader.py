@@ -1,11 +1,15 @@
 """ Retrospective Reader (Retro-Reader). """
 
 import math
-import numpy as np
 
 from ...third import tf
 from .._base_._base_ import BaseDecoder
 from .. import util
+from ... import com
+
+# additive score of masked attention positions, kept as a Python float so
+# that each graph folds it into its own adder
+NEG_INF = -10000.0
 
 
 class RetroReaderDecoder(BaseDecoder):
@@ -23,15 +27,35 @@ class RetroReaderDecoder(BaseDecoder):
                  beta_1=0.5,
                  beta_2=0.5,
                  threshold=1.0,
+                 int8_inference=False,
+                 attention_dtype=tf.float32,
+                 compile_decoder=False,
+                 attention_chunk_size=None,
+                 compile_attention=False,
                  trainable=True,
                  **kwargs):
         super().__init__(**kwargs)
 
+        # int8 matmuls of prediction heads and attention projections,
+        # CPU inference only
+        quantized = int8_inference and not is_training
+        matmul = quantized_matmul if quantized else tf.matmul
+        if quantized:
+            attention_dtype = tf.float32
+
         if kwargs.get("return_hidden"):
             self.tensors["hidden"] = intensive_encoder.get_sequence_output()[:, 0, :]
 
-        # verifier
-        with tf.variable_scope(scope):
+        # verifier, optionally compiled by XLA, which fuses the element-wise
+        # ops into the surrounding matmuls
+        with tf.variable_scope(scope), jit_scope(compile_decoder):
+
+            # additive attention mask over the query, built once and shared
+            # by the attention layers of the decoder
+            self._attn_adder = None
+            if matching_mechanism == "cross-attention":
+                self._attn_adder = self.create_attention_adder_from_input_mask(
+                    query_mask, *util.get_shape_list(query_mask, expected_rank=2))
 
             # sketchy reading module
             with tf.variable_scope("sketchy/prediction"):
@@ -53,7 +77,7 @@ class RetroReaderDecoder(BaseDecoder):
                 output_layer = util.dropout(
                     sketchy_output, bert_config.hidden_dropout_prob \
                         if is_training else 0.0)
-                logits = tf.matmul(
+                logits = matmul(
                     output_layer, output_weights, transpose_b=True)
                 logits = tf.nn.bias_add(logits, output_bias)
 
@@ -76,20 +100,24 @@ class RetroReaderDecoder(BaseDecoder):
                 # cross-attention
                 if matching_mechanism == "cross-attention":
                     with tf.variable_scope("cross_attention"):
-                        attention_mask = self.create_attention_mask_from_input_mask(
-                            query_mask, batch_size, max_seq_length)
-                        H_prime, _ = self.attention_layer(
+                        H_prime = self.attention_layer(
                             from_tensor=H,
                             to_tensor=H_Q,
-                            attention_mask=attention_mask,
+                            attention_adder=self._attn_adder,
                             num_attention_heads=bert_config.num_attention_heads,
                             size_per_head=hidden_size // bert_config.num_attention_heads,
-                            attention_probs_dropout_prob=bert_config.hidden_dropout_prob,
+                            attention_probs_dropout_prob=bert_config.hidden_dropout_prob \
+                                if is_training else 0.0,
                             initializer_range=bert_config.initializer_range,
                             do_return_2d_tensor=False,
                             batch_size=batch_size,
                             from_max_seq_length=max_seq_length,
                             to_max_seq_length=max_seq_length,
+                            dtype=attention_dtype,
+                            chunk_size=attention_chunk_size,
+                            jit_compile=compile_attention and not compile_decoder,
+                            defer_normalization=compile_attention or compile_decoder,
+                            quantized=quantized,
                             trainable=trainable)
 
                 # matching-attention
@@ -106,15 +134,46 @@ class RetroReaderDecoder(BaseDecoder):
                             shape=[hidden_size],
                             initializer=tf.zeros_initializer(),
                             trainable=trainable)
-                        trans = tf.matmul(
-                            H_Q, tf.tile(
-                                tf.expand_dims(output_weights, axis=0),
-                                [batch_size, 1, 1]),
-                            transpose_b=True)
-                        trans = tf.nn.bias_add(trans, output_bias)
-                        M = tf.nn.softmax(
-                            tf.matmul(H, trans, transpose_b=True), axis=-1)
-                        H_prime = tf.matmul(M, H_Q)
+
+                        if compile_decoder:
+
+                            # XLA needs static shapes, so attend to all the
+                            # T positions.
+                            trans = tf.matmul(
+                                tf.reshape(H_Q, [batch_size * max_seq_length, hidden_size]),
+                                output_weights, transpose_b=True)
+                            trans = tf.nn.bias_add(trans, output_bias)
+                            trans = tf.reshape(trans, [batch_size, max_seq_length, hidden_size])
+                            M = tf.nn.softmax(
+                                tf.matmul(H, trans, transpose_b=True), axis=-1)
+                            H_prime = tf.matmul(M, H_Q)
+                        else:
+
+                            # Only the leading window of Q positions that holds
+                            # the query (the question segment) is attended to.
+                            # Beyond it, `H_Q` is zero and `trans` is the bias
+                            # alone, so those T - Q positions share one score,
+                            # which enters the softmax once with its multiplicity
+                            # in log-space. The result equals the full [B, T, T]
+                            # attention.
+                            query_length = tf.reduce_max(
+                                tf.cast(query_mask, tf.int32) * tf.range(1, max_seq_length + 1))
+                            H_Q = H_Q[:, :query_length]
+                            trans = tf.matmul(
+                                tf.reshape(H_Q, [-1, hidden_size]),
+                                output_weights, transpose_b=True)
+                            trans = tf.nn.bias_add(trans, output_bias)
+                            trans = tf.reshape(trans, [batch_size, -1, hidden_size])
+
+                            # scores = [B, T, Q + 1]
+                            outer_score = tf.reduce_sum(
+                                H * output_bias, axis=-1, keepdims=True)
+                            outer_score += tf.log(
+                                tf.cast(max_seq_length - query_length, tf.float32))
+                            scores = tf.concat(
+                                [tf.matmul(H, trans, transpose_b=True), outer_score], axis=-1)
+                            M = tf.nn.softmax(scores, axis=-1)[:, :, :-1]
+                            H_prime = tf.matmul(M, H_Q)
 
                 with tf.variable_scope("prediction"):
                     output_weights = tf.get_variable(
@@ -129,11 +188,18 @@ class RetroReaderDecoder(BaseDecoder):
                         trainable=trainable)
 
                     output_layer = util.dropout(H_prime, bert_config.hidden_dropout_prob if is_training else 0.0)
-                    output_layer = tf.reshape(output_layer, [batch_size * max_seq_length, hidden_size])
-                    logits = tf.matmul(output_layer, output_weights, transpose_b=True)
-                    logits = tf.nn.bias_add(logits, output_bias)
-                    logits = tf.reshape(logits, [batch_size, max_seq_length, 2])
-                    logits = tf.transpose(logits, [0, 2, 1])
+                    if quantized:
+                        output_layer = tf.reshape(output_layer, [batch_size * max_seq_length, hidden_size])
+                        logits = matmul(output_layer, output_weights, transpose_b=True)
+                        logits = tf.nn.bias_add(logits, output_bias)
+                        logits = tf.reshape(logits, [batch_size, max_seq_length, 2])
+                        logits = tf.transpose(logits, [0, 2, 1])
+                    else:
+
+                        # contract straight into the [B, 2, T] layout of start
+                        # and end logits, without transposing [B, T, 2] after
+                        logits = tf.einsum("kh,bth->bkt", output_weights, output_layer)
+                        logits += tf.expand_dims(output_bias, axis=-1)
                     probs = tf.nn.softmax(logits, axis=-1, name="probs")
 
                     self.tensors["mrc_probs"] = probs
@@ -148,33 +214,39 @@ class RetroReaderDecoder(BaseDecoder):
                     intensive_loss = tf.reduce_mean(per_example_loss)
                     self.tensors["intensive_losses"] = per_example_loss
 
-                    score_has = tf.norm(probs[:, 0, 1:] + probs[:, 1, 1:], np.inf, axis=-1)
+                    # Probabilities are non-negative, so the infinity norm of
+                    # the summed span probabilities is a plain max. Each score
+                    # is a standalone add-reduce chain, which XLA fuses into a
+                    # single pass over the probabilities.
+                    score_has = tf.reduce_max(probs[:, 0, 1:] + probs[:, 1, 1:], axis=-1)
                     score_null = probs[:, 0, 0] + probs[:, 1, 0]
-                    score_diff = score_has - score_null
 
-            # rear verification
-            v = beta_1 * score_diff + beta_2 * score_ext
+            # Rear verification. Kept as one chain of element-wise ops with
+            # no control dependencies in between, which XLA fuses into a
+            # single kernel.
+            v = beta_1 * (score_has - score_null) + beta_2 * score_ext
             self.tensors["verifier_preds"] = tf.cast(tf.greater(v, threshold), tf.int32)
             self.tensors["verifier_probs"] = v
 
             self.train_loss = sketchy_loss + intensive_loss
 
-    def create_attention_mask_from_input_mask(self,
-                                              to_mask,
-                                              batch_size,
-                                              max_seq_length,
-                                              dtype=tf.float32):
+    def create_attention_adder_from_input_mask(self,
+                                               to_mask,
+                                               batch_size,
+                                               max_seq_length,
+                                               dtype=tf.float32):
+        # Masked positions get `NEG_INF` and the rest 0.0. The adder is
+        # broadcast over heads and from-positions as [B, 1, 1, T] when
+        # added to the scores, so no [B, F, T] mask is ever built.
         to_mask = tf.cast(tf.reshape(
-            to_mask, [batch_size, 1, max_seq_length]), dtype=dtype)
-        broadcast_ones = tf.ones(
-            shape=[batch_size, max_seq_length, 1], dtype=dtype)
-        mask = broadcast_ones * to_mask
-        return mask
+            to_mask, [batch_size, 1, 1, max_seq_length]), dtype=dtype)
+        adder = (1.0 - to_mask) * NEG_INF
+        return adder
 
     def attention_layer(self,
                         from_tensor,
                         to_tensor,
-                        attention_mask=None,
+                        attention_adder=None,
                         num_attention_heads=12,
                         size_per_head=512,
                         query_act=None,
@@ -187,113 +259,219 @@ class RetroReaderDecoder(BaseDecoder):
                         from_max_seq_length=None,
                         to_max_seq_length=None,
                         dtype=tf.float32,
+                        chunk_size=None,
+                        quantized=False,
+                        jit_compile=False,
+                        defer_normalization=False,
                         trainable=True):
 
-        def transpose_for_scores(input_tensor, batch_size,
-                                 num_attention_heads, max_seq_length, width):
-            output_tensor = tf.reshape(
-                input_tensor,
-                [batch_size, max_seq_length, num_attention_heads, width])
-            output_tensor = tf.transpose(output_tensor, [0, 2, 1, 3])
-            return output_tensor
-
-        # Scalar dimensions referenced here:
-        #   B = batch size (number of sequences)
-        #   F = from_tensor sequence length
-        #   T = to_tensor sequence length
-        #   N = num_attention_heads
-        #   H = size_per_head
-
-        from_tensor_2d = util.reshape_to_matrix(from_tensor)
-        to_tensor_2d = util.reshape_to_matrix(to_tensor)
-
-        # query_layer = [B*F, N*H]
-        query_layer = tf.layers.dense(
-            from_tensor_2d,
-            num_attention_heads * size_per_head,
-            activation=query_act,
-            name="query",
-            kernel_initializer=util.create_initializer(initializer_range),
-            trainable=trainable)
-
-        # key_layer = [B*T, N*H]
-        key_layer = tf.layers.dense(
-            to_tensor_2d,
-            num_attention_heads * size_per_head,
-            activation=key_act,
-            name="key",
-            kernel_initializer=util.create_initializer(initializer_range),
-            trainable=trainable)
-
-        # value_layer = [B*T, N*H]
-        value_layer = tf.layers.dense(
-            to_tensor_2d,
-            num_attention_heads * size_per_head,
-            activation=value_act,
-            name="value",
-            kernel_initializer=util.create_initializer(initializer_range),
-            trainable=trainable)
-
-        # query_layer = [B, N, F, H]
-        query_layer = transpose_for_scores(
-            query_layer, batch_size, num_attention_heads,
-            from_max_seq_length, size_per_head)
-
-        # key_layer = [B, N, T, H]
-        key_layer = transpose_for_scores(
-            key_layer, batch_size, num_attention_heads,
-            to_max_seq_length, size_per_head)
-
-        # Take the dot product between "query" and "key" to get the raw
-        # attention scores.
-        # attention_scores = [B, N, F, T]
-        attention_scores = tf.matmul(query_layer, key_layer, transpose_b=True)
-        attention_scores = tf.multiply(
-            attention_scores, 1.0 / math.sqrt(float(size_per_head)))
-
-        if attention_mask is not None:
-
-            # attention_mask = [B, 1, F, T]
-            attention_mask = tf.expand_dims(attention_mask, axis=[1])
-            adder = (1.0 - tf.cast(attention_mask, dtype)) * -10000.0
-            attention_scores += adder
-
-        # Normalize the attention scores to probabilities.
-        # attention_probs = [B, N, F, T]
-        attention_probs = tf.nn.softmax(attention_scores, axis=-1)
-
-        # This is actually dropping out entire tokens to attend to,
-        # which might seem a bit unusual, but is taken from the original
-        # Transformer paper.
-        attention_probs = util.dropout(
-            attention_probs, attention_probs_dropout_prob)
-
-        # value_layer = [B, T, N, H]
-        value_layer = tf.reshape(
-            value_layer, [batch_size, to_max_seq_length,
-                          num_attention_heads, size_per_head])
-
-        # value_layer = [B, N, T, H]
-        value_layer = tf.transpose(value_layer, [0, 2, 1, 3])
-
-        # context_layer = [B, N, F, H]
-        context_layer = tf.matmul(attention_probs, value_layer)
-
-        # context_layer = [B, F, N, H]
-        context_layer = tf.transpose(context_layer, [0, 2, 1, 3])
-
-        if do_return_2d_tensor:
-            # context_layer = [B*F, N*H]
-            context_layer = tf.reshape(
-                context_layer, [batch_size * from_max_seq_length,
-                                num_attention_heads * size_per_head])
-        else:
-            # context_layer = [B, F, N*H]
-            context_layer = tf.reshape(
-                context_layer, [batch_size, from_max_seq_length,
-                                num_attention_heads * size_per_head])
-
-        return (context_layer, attention_scores)
+        # Shapes here are static except for the batch size, and batches
+        # are always filled up to `batch_size`, so XLA compiles the whole
+        # attention into one shape-specialized cluster.
+        with jit_scope(jit_compile):
+
+            # Scalar dimensions referenced here:
+            #   B = batch size (number of sequences)
+            #   F = from_tensor sequence length
+            #   T = to_tensor sequence length
+            #   N = num_attention_heads
+            #   H = size_per_head
+
+            # Matmuls run in `dtype`, e.g. float16 or bfloat16 on tensor cores,
+            # while softmax stays in float32 for numerical stability.
+            # Variables are kept in float32 as master weights.
+            is_self_attention = from_tensor is to_tensor
+            from_tensor = tf.cast(from_tensor, dtype)
+            to_tensor = tf.cast(to_tensor, dtype)
+
+            def get_dense_weights(name, input_width):
+                # same variables as `tf.layers.dense`, so that checkpoints of
+                # separate projections keep loading
+                with tf.variable_scope(name):
+                    kernel = tf.get_variable(
+                        "kernel",
+                        shape=[input_width, num_attention_heads * size_per_head],
+                        initializer=util.create_initializer(initializer_range),
+                        trainable=trainable)
+                    bias = tf.get_variable(
+                        "bias",
+                        shape=[num_attention_heads * size_per_head],
+                        initializer=tf.zeros_initializer(),
+                        trainable=trainable)
+                return tf.cast(kernel, dtype), tf.cast(bias, dtype)
+
+            def fused_dense(input_tensor, names, activations):
+                # Projections sharing one input run as a single contraction
+                # over the concatenated kernels, reading the input only once.
+                # Kernels are viewed per head, so that outputs come out as
+                # [B, S, N, H] with neither flattening nor head-splitting
+                # reshapes of the activations.
+                (input_batch_size, input_seq_length, input_width) = \
+                    util.get_shape_list(input_tensor, expected_rank=3)
+                weights = [get_dense_weights(name, input_width) for name in names]
+                kernel = tf.concat([w[0] for w in weights], axis=-1)
+                bias = tf.concat([w[1] for w in weights], axis=-1)
+                num_heads = len(names) * num_attention_heads
+                bias = tf.reshape(bias, [num_heads, size_per_head])
+                if quantized:
+                    output_tensor = quantized_matmul(
+                        tf.reshape(input_tensor, [-1, input_width]), kernel)
+                    output_tensor = tf.reshape(
+                        output_tensor, [input_batch_size, input_seq_length,
+                                        num_heads, size_per_head])
+                else:
+                    kernel = tf.reshape(
+                        kernel, [input_width, num_heads, size_per_head])
+                    output_tensor = tf.einsum(
+                        "bsw,wnh->bsnh", input_tensor, kernel)
+                output_tensor += bias
+                output_tensors = tf.split(output_tensor, len(names), axis=2)
+                return [act(tensor) if act else tensor
+                        for tensor, act in zip(output_tensors, activations)]
+
+            if is_self_attention:
+
+                # self-attention: query_layer, key_layer, value_layer = [B, F, N, H]
+                (query_layer, key_layer, value_layer) = fused_dense(
+                    from_tensor, ["query", "key", "value"],
+                    [query_act, key_act, value_act])
+            else:
+
+                # query_layer = [B, F, N, H]
+                (query_layer,) = fused_dense(
+                    from_tensor, ["query"], [query_act])
+
+                # key_layer, value_layer = [B, T, N, H]
+                (key_layer, value_layer) = fused_dense(
+                    to_tensor, ["key", "value"], [key_act, value_act])
+
+            # The contractions below read the [B, F/T, N, H] layouts
+            # directly, without transposing copies.
+
+            # Scale the queries rather than the raw scores, which spares a full
+            # pass over the [B, N, F, T] tensor.
+            query_layer = tf.multiply(
+                query_layer, 1.0 / math.sqrt(float(size_per_head)))
+
+            def attend(query_layer):
+
+                # Take the dot product between "query" and "key" to get the scaled
+                # attention scores.
+                # attention_scores = [B, N, F, T]
+                attention_scores = tf.einsum("bfnh,btnh->bnft", query_layer, key_layer)
+                attention_scores = tf.cast(attention_scores, tf.float32)
+
+                if attention_adder is not None:
+
+                    # attention_adder = [B, 1, 1, T]
+                    attention_scores += attention_adder
+
+                # Normalize the attention scores to probabilities.
+                # attention_probs = [B, N, F, T]
+                if defer_normalization:
+
+                    # Leave the probabilities unnormalized and divide the
+                    # [B, F, N, H] context by the softmax denominator
+                    # instead. This saves the division pass over the
+                    # [B, N, F, T] tensor, and XLA fuses max, exp and sum
+                    # into the score contraction. Dropout commutes with the
+                    # per-row division, so results are unchanged.
+                    attention_scores -= tf.stop_gradient(
+                        tf.reduce_max(attention_scores, axis=-1, keepdims=True))
+                    attention_probs = tf.exp(attention_scores)
+                    denominator = tf.reduce_sum(attention_probs, axis=-1)
+                else:
+                    attention_probs = tf.nn.softmax(attention_scores, axis=-1)
+                attention_probs = tf.cast(attention_probs, dtype)
+
+                # This is actually dropping out entire tokens to attend to,
+                # which might seem a bit unusual, but is taken from the original
+                # Transformer paper.
+                attention_probs = util.dropout(
+                    attention_probs, attention_probs_dropout_prob)
+
+                # context_layer = [B, F, N, H]
+                context_layer = tf.einsum("bnft,btnh->bfnh", attention_probs, value_layer)
+                if defer_normalization:
+
+                    # denominator = [B, F, N, 1]
+                    denominator = tf.expand_dims(
+                        tf.transpose(denominator, [0, 2, 1]), axis=-1)
+                    context_layer /= tf.cast(denominator, dtype)
+                return context_layer
+
+            if not chunk_size or chunk_size >= from_max_seq_length:
+                context_layer = attend(query_layer)
+            else:
+                assert from_max_seq_length % chunk_size == 0, (
+                    "`max_seq_length` (%d) should be divisible by the attention "
+                    "chunk size (%d)." % (from_max_seq_length, chunk_size))
+                num_chunks = from_max_seq_length // chunk_size
+
+                # Chunks of queries attend one after another, so that the peak
+                # memory of scores drops from [B, N, F, T] to [B, N, F/K, T].
+                # The softmax runs over T, thus each chunk is independent.
+                # query_chunks = [K, B, F/K, N, H]
+                query_chunks = tf.reshape(
+                    query_layer, [batch_size, num_chunks, chunk_size,
+                                  num_attention_heads, size_per_head])
+                query_chunks = tf.transpose(query_chunks, [1, 0, 2, 3, 4])
+                context_chunks = tf.map_fn(
+                    attend, query_chunks, parallel_iterations=1)
+
+                # context_layer = [B, F, N, H]
+                context_layer = tf.transpose(context_chunks, [1, 0, 2, 3, 4])
+                context_layer = tf.reshape(
+                    context_layer, [batch_size, from_max_seq_length,
+                                    num_attention_heads, size_per_head])
+            context_layer = tf.cast(context_layer, tf.float32)
+
+            if do_return_2d_tensor:
+                # context_layer = [B*F, N*H]
+                context_layer = tf.reshape(
+                    context_layer, [batch_size * from_max_seq_length,
+                                    num_attention_heads * size_per_head])
+            else:
+                # context_layer = [B, F, N*H]
+                context_layer = tf.reshape(
+                    context_layer, [batch_size, from_max_seq_length,
+                                    num_attention_heads * size_per_head])
+
+            return context_layer
+
+
+def jit_scope(compile_ops=True):
+    """ XLA `jit_scope` leaving variables out of compilation, or a null
+    context if `compile_ops` is False. """
+    if not compile_ops:
+        return com.Null()
+    return tf.xla.experimental.jit_scope(
+        compile_ops=lambda node_def: node_def.op not in (
+            "VariableV2", "VarHandleOp", "Assign", "AssignVariableOp"))
+
+
+def quantized_matmul(a, b, transpose_b=False):
+    """ Dynamic-range int8 counterpart of `tf.matmul` on 2-D tensors.
+    Both operands are quantized over their own value range, multiplied
+    into int32 accumulators and dequantized back to float32. """
+
+    def quantize(x):
+        # the quantized range must cover zero
+        min_x = tf.minimum(tf.reduce_min(x), 0.0)
+        max_x = tf.maximum(tf.reduce_max(x), 0.0)
+        return tf.quantization.quantize(x, min_x, max_x, tf.quint8, mode="MIN_FIRST")
+
+    q_a = quantize(a)
+    q_b = quantize(b)
+    (output, min_output, max_output) = tf.raw_ops.QuantizedMatMul(
+        a=q_a.output, b=q_b.output,
+        min_a=q_a.output_min, max_a=q_a.output_max,
+        min_b=q_b.output_min, max_b=q_b.output_max,
+        Toutput=tf.qint32, transpose_b=transpose_b)
+
+    # scale the accumulators straight into float32, since dequantizing
+    # in MIN_COMBINED mode shifts them by 2^31 first and drops low bits
+    return tf.cast(output, tf.float32) * ((max_output - min_output) / (2.0 ** 32 - 1))
 
 
 def get_decay_power(num_hidden_layers):
@@ -27,6 +27,11 @@ class RetroReaderMRC(BERTVerifierMRC, MRCModule):
         beta_2=0.5,
         threshold=1.0,
         truncate_method="longer-FO",
+        int8_inference=False,
+        attention_dtype="fp32",
+        compile_decoder=False,
+        attention_chunk_size=None,
+        compile_attention=False,
     ):
         self.__init_args__ = locals()
         super(MRCModule, self).__init__(init_checkpoint, output_dir, gpu_ids)
@@ -35,6 +40,11 @@ class RetroReaderMRC(BERTVerifierMRC, MRCModule):
         self.truncate_method = truncate_method
         self.beta_1 = beta_1
         self.beta_2 = beta_2
+        self.int8_inference = int8_inference
+        self.attention_dtype = attention_dtype
+        self.compile_decoder = compile_decoder
+        self.attention_chunk_size = attention_chunk_size
+        self.compile_attention = compile_attention
         self._do_lower_case = do_lower_case
         self._matching_mechanism = matching_mechanism
         self._threshold = threshold
@@ -44,6 +54,10 @@ class RetroReaderMRC(BERTVerifierMRC, MRCModule):
             "Invalid value of `matching_machanism`: %s. Pick one from "
             "`cross-attention` and `matching-attention`."
         )
+        assert attention_dtype in ("fp32", "fp16", "bf16"), (
+            "Invalid value of `attention_dtype`: %s. Pick one from "
+            "`fp32`, `fp16` and `bf16`." % attention_dtype
+        )
         self.tokenizer = WordPieceTokenizer(vocab_file, do_lower_case)
         self.decay_power = get_decay_power(self.bert_config.num_hidden_layers)
 
@@ -199,6 +213,11 @@ class RetroReaderMRC(BERTVerifierMRC, MRCModule):
             beta_1=self.beta_1,
             beta_2=self.beta_2,
             threshold=self._threshold,
+            int8_inference=self.int8_inference,
+            attention_dtype={"fp32": tf.float32, "fp16": tf.float16, "bf16": tf.bfloat16}[self.attention_dtype],
+            compile_decoder=self.compile_decoder,
+            attention_chunk_size=self.attention_chunk_size,
+            compile_attention=self.compile_attention,
             trainable=True,
             **kwargs,
         )
@@ -272,6 +272,11 @@ def layer_norm_and_dropout(input_tensor, dropout_prob, trainable=True):
 def cross_entropy(logits, label_ids, label_size, **kwargs):
     """ Cross Entropy Loss for single-label classification. """
 
+    # without any variant, compute with the fused sparse kernel and skip the one-hot labels
+    if (not kwargs.get("focal_loss") and not kwargs.get("label_smoothing")
+            and kwargs.get("tsa_thresh") is None and kwargs.get("conf_thresh") is None):
+        return tf.nn.sparse_softmax_cross_entropy_with_logits(labels=label_ids, logits=logits)
+
     log_probs = tf.nn.log_softmax(logits, axis=-1)
     one_hot_labels = tf.one_hot(label_ids, depth=label_size, dtype=tf.float32)
 
@@ -5,4 +5,5 @@ from .parallel import *
 from .resource import *
 from .text import *
 from .tfrecords import *
+from .trt import *
 from .com import *
@@ -62,6 +62,17 @@ def set_log(log_file):
     log.addHandler(fh)
 
 
+def ensure_special_tokens(tokenizer, config, tokens):
+    """ Add the missing special tokens into vocabulary, and enlarge `vocab_size` of the model configuration accordingly. """
+    missing_tokens = [token for token in tokens if token not in tokenizer.vocab]
+    if not missing_tokens:
+        return
+    tokenizer.add_many(missing_tokens)
+    config.vocab_size += len(missing_tokens)
+    for token in missing_tokens:
+        tf.logging.info("Add necessary token `%s` into vocabulary." % token)
+
+
 def truncate_segments(segments, max_seq_length, truncate_method="LIFO"):
     """ Truncate sequence segments to avoid the overall length exceeds the `max_seq_length`. """
     total_seq_length = sum([len(segment) for segment in segments])
@@ -0,0 +1,45 @@
+import inspect
+
+from ..third import tf
+
+
+class TRTPredictor:
+    """ Runs the frozen inference graph, optimized by TF-TRT, in a standalone session.
+
+    Supported TensorRT subgraphs (e.g. attention and feed-forward blocks of
+    the encoder) are replaced by engines of the given precision, built for
+    fixed inputs of `[max_batch_size, ...]`. The rest runs in Tensorflow. """
+
+    def __init__(self, sess, fetches, max_batch_size, precision_mode="FP16"):
+        from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+        output_names = [fetch.op.name for fetch in fetches]
+        frozen_graph_def = tf.graph_util.convert_variables_to_constants(
+            sess, sess.graph.as_graph_def(), output_names,
+        )
+
+        # `nodes_blacklist` is renamed to `nodes_denylist` since tf 2.4
+        parameters = inspect.signature(trt.TrtGraphConverter.__init__).parameters
+        nodes_key = "nodes_denylist" if "nodes_denylist" in parameters else "nodes_blacklist"
+        converter = trt.TrtGraphConverter(
+            input_graph_def=frozen_graph_def,
+            max_batch_size=max_batch_size,
+            precision_mode=precision_mode,
+            is_dynamic_op=False,
+            **{nodes_key: output_names},
+        )
+        trt_graph_def = converter.convert()
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(trt_graph_def, name="")
+        self.sess = tf.Session(graph=self.graph, config=sess._config)
+
+    def run(self, fetches, feed_dict):
+        """ Same as `sess.run()`, with tensors of the original graph as keys. """
+        fetches = [self.graph.get_tensor_by_name(fetch.name) for fetch in fetches]
+        feed_dict = {self.graph.get_tensor_by_name(key.name): value for key, value in feed_dict.items()}
+        return self.sess.run(fetches, feed_dict=feed_dict)
+
+    def close(self):
+        self.sess.close()
@@ -58,6 +58,11 @@ class BaseModule:
         except AttributeError:
             pass
 
+        # release TensorRT engines built on the previous session
+        if self.__dict__.get("_trt_cache") is not None:
+            self._trt_cache[2].close()
+        self._trt_cache = None
+
         # runtime attributes
         self.batch_size = 0
         self._id_to_label = None
@@ -11,6 +11,8 @@ class Task:
 
     This is an internal class that does not provide interface for outside requests."""
 
+    _session_started = False    # whether any session, hence CUDA, has been initialized in this process
+
     def __init__(self, module):
         self.module = module
 
@@ -32,14 +34,78 @@ class Task:
             os.environ["CUDA_VISIBLE_DEVICES"] = ",".join(self.module._gpu_ids)
         else:
             os.environ["CUDA_VISIBLE_DEVICES"] = "-1"           # disable GPUs
+        self._set_tensor_float_32()
         config = tf.ConfigProto(
             allow_soft_placement=True,
             gpu_options=tf.GPUOptions(allow_growth=True, per_process_gpu_memory_fraction=1.0),
         )
+        self._set_mixed_precision(config)
+        self._set_jit_compile(config)
         self.module.sess = tf.Session(graph=self.module.graph, config=config)
+        Task._session_started = True
         self._init_variables(self.module.global_variables, ignore_checkpoint=ignore_checkpoint)
         self.module._session_built = True
 
+    def _set_mixed_precision(self, config):
+        """ Let grappler rewrite float32 ops into bfloat16 if the module requires.
+        CPU (oneDNN) only: the rewriters leave GPU nodes in float32. """
+        mixed_precision = self.module.__dict__.get("mixed_precision", "fp32")
+        if mixed_precision == "fp32":
+            return
+        if mixed_precision != "bf16":
+            raise ValueError("Invalid value for `mixed_precision`: %s. Pick one from `fp32` and `bf16`." % mixed_precision)
+        if self.module._gpu_ids:
+            tf.logging.warning(
+                "Mixed precision of bfloat16 only rewrites CPU ops in oneDNN builds. "
+                "Ops placed on GPUs %s keep running in float32." % ",".join(self.module._gpu_ids)
+            )
+
+        # Numerically sensitive ops, e.g. softmax and cross entropy, are kept
+        # in float32 by the rewriter, and variables stay in float32 as master
+        # weights.
+        rewrite_options = config.graph_options.rewrite_options
+        if hasattr(rewrite_options, "auto_mixed_precision_onednn_bfloat16"):    # tf >= 2.9
+            rewrite_options.auto_mixed_precision_onednn_bfloat16 = type(rewrite_options).ON
+        elif hasattr(rewrite_options, "auto_mixed_precision_mkl"):              # tf >= 2.4
+            rewrite_options.auto_mixed_precision_mkl = type(rewrite_options).ON
+        else:
+            tf.logging.warning("Mixed precision of bfloat16 requires tensorflow >= 2.4. Computing in float32 instead.")
+
+    def _set_jit_compile(self, config):
+        """ Compile the graph on GPUs with XLA if the module requires. """
+        if not self.module.__dict__.get("jit_compile"):
+            return
+        if not self.module._gpu_ids:
+            tf.logging.warning(
+                "Global XLA compilation only clusters GPU ops. To compile CPU ops as well, "
+                "set `TF_XLA_FLAGS=--tf_xla_cpu_global_jit` before tensorflow is imported."
+            )
+
+        # Clusters are compiled and cached by input shapes. Since batches are
+        # always filled up to `batch_size` (see `_build_feed_dict`), they are
+        # compiled only once for each pair of batch size and sequence length,
+        # where LayerNorm, GELU and element-wise ops get fused into kernels.
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+
+    def _set_tensor_float_32(self):
+        """ Switch TensorFloat-32 matmul/conv on Ampere GPUs if the module specifies.
+        The switch is process-wide, so it is left alone unless `tensor_cores` is set. """
+        tensor_cores = self.module.__dict__.get("tensor_cores")
+        if tensor_cores is None:
+            return
+
+        # TF32 keeps the float32 range but rounds inputs to a 10-bit mantissa,
+        # so outputs are expected to differ from float32 by around 1e-3 (relative).
+        if hasattr(tf, "config") and hasattr(tf.config.experimental, "enable_tensor_float_32_execution"):    # tf >= 2.4
+            tf.config.experimental.enable_tensor_float_32_execution(bool(tensor_cores))
+        else:
+            if Task._session_started:
+                tf.logging.warning(
+                    "`tensor_cores` falls back to `NVIDIA_TF32_OVERRIDE`, which is only read when CUDA "
+                    "initializes. A session already exists in this process, so it may take no effect."
+                )
+            os.environ["NVIDIA_TF32_OVERRIDE"] = "1" if tensor_cores else "0"
+
     def _init_variables(self, variables, ignore_checkpoint=False):
         """ Initialize variables in the session. """
 
@@ -1,6 +1,7 @@
 import time
 
 from ..third import tf
+from .. import com
 from ._base_ import Task
 
 
@@ -22,6 +23,11 @@ class Inference(Task):
         if not self.module._session_built:
             self._init_session()
 
+        # optimize the frozen graph with TensorRT
+        self._trt_predictor = None
+        if self.module.__dict__.get("use_tensorrt"):
+            self._trt_predictor = self._get_trt_predictor()
+
         tf.logging.info("Running inference on %d samples", n_inputs)
 
         # inference
@@ -41,7 +47,10 @@ class Inference(Task):
     def _predict_one_batch(self, step, last_tic, last_step, total_steps, batch_outputs):
         feed_dict = self._build_feed_dict()
         predict_ops = self.module._get_predict_ops()
-        output_arrays = self.module.sess.run(predict_ops, feed_dict=feed_dict)
+        if self._trt_predictor is not None:
+            output_arrays = self._trt_predictor.run(predict_ops, feed_dict)
+        else:
+            output_arrays = self.module.sess.run(predict_ops, feed_dict=feed_dict)
         batch_outputs.append(output_arrays)
 
         # print
@@ -58,3 +67,35 @@ class Inference(Task):
             last_step = step
 
         return last_tic, last_step
+
+    def _get_trt_predictor(self):
+        """ Build or reuse the TensorRT predictor for the current weights and input shapes. """
+
+        # Engines are built for fixed shapes and have the weights frozen in,
+        # so only the latest one is kept in memory and never reused across
+        # sessions or checkpoints. The session is compared by identity and
+        # held by the cache, so that its id can not be recycled.
+        key = (
+            self.module.init_checkpoint, self.module.step,
+            self.module.batch_size, self.module.max_seq_length,
+        )
+        cached = self.module._trt_cache
+        if cached is not None and cached[0] is self.module.sess and cached[1] == key:
+            return cached[2]
+        if cached is not None:
+            cached[2].close()
+            self.module._trt_cache = None
+
+        tf.logging.info("Building TensorRT engines of FP16 for batch size %d" % self.module.batch_size)
+        try:
+            trt_predictor = com.TRTPredictor(
+                self.module.sess,
+                self.module._get_predict_ops(),
+                max_batch_size=self.module.batch_size,
+                precision_mode="FP16",
+            )
+        except Exception as e:
+            tf.logging.warning("Failed to build TensorRT engines, running inference in Tensorflow instead. (%s)" % e)
+            return None
+        self.module._trt_cache = (self.module.sess, key, trt_predictor)
+        return trt_predictor
@@ -6,6 +6,7 @@
 import os
 import collections
 import unicodedata
+import numpy as np
 
 from ..com import is_whitespace, is_control, is_punctuation, is_chinese_char
 from ..third import tf
@@ -21,11 +22,20 @@ class WordPieceTokenizer:
             )
         self.vocab = load_vocab(vocab_file)  # word: idx
         self.inv_vocab = {v: k for k, v in self.vocab.items()}
+        self._vocab_words = None
+        self._id_to_token_np = None
         self.processor = [
             BasicTokenizer(do_lower_case=do_lower_case),
             WordpieceTokenizer(vocab=self.vocab),
         ]
 
+    @property
+    def vocab_words(self):
+        """ Tuple of vocabulary words, rebuilt only when the vocabulary grows. """
+        if self._vocab_words is None or len(self._vocab_words) != len(self.vocab):
+            self._vocab_words = tuple(self.vocab.keys())
+        return self._vocab_words
+
     def tokenize(self, text):
         tokens = []
         for token in self.processor[0].tokenize(text):
@@ -37,14 +47,44 @@ class WordPieceTokenizer:
         ids = convert_by_vocab(self.vocab, tokens)
         return [_id if _id else self.vocab.get("[UNK]", 0) for _id in ids]
 
+    def convert_tokens_to_ids_np(self, tokens, out=None):
+        """ Same as `convert_tokens_to_ids`, but writes int32 ids into the
+        leading slots of `out` (or a new array) without an interim list. """
+        n = len(tokens)
+        vocab_get = self.vocab.get
+        unk_id = vocab_get("[UNK]", 0)
+        ids = np.fromiter((vocab_get(token) or unk_id for token in tokens), dtype=np.int32, count=n)
+        if out is None:
+            return ids
+        out[:n] = ids
+        return out[:n]
+
     def convert_ids_to_tokens(self, ids):
         tokens = convert_by_vocab(self.inv_vocab, ids)
         return [_token if _token else "[UNK]" for _token in tokens]
 
+    def convert_ids_to_tokens_np(self, ids):
+        """ Same as `convert_ids_to_tokens`, but gathers tokens of an int
+        array in one go from an object array of the vocabulary. """
+        n = len(self.vocab)
+        if self._id_to_token_np is None or len(self._id_to_token_np) != n + 1:
+
+            # one trailing "[UNK]" for ids out of the vocabulary
+            self._id_to_token_np = np.array(
+                [self.inv_vocab.get(i, "[UNK]") for i in range(n)] + ["[UNK]"], dtype=object,
+            )
+        return self._id_to_token_np[np.minimum(ids, n)].tolist()
+
     def add(self, char):
         index = len(self.vocab)
         self.vocab[char] = index
         self.inv_vocab[index] = char
+        self._id_to_token_np = None
+
+    def add_many(self, chars):
+        for char in chars:
+            if char not in self.vocab:
+                self.add(char)
 
 
 class BasicTokenizer:
@@ -135,54 +175,151 @@ class BasicTokenizer:
 
 
 class WordpieceTokenizer:
-    """Runs WordPiece tokenziation."""
+    """Runs WordPiece tokenziation.
+
+    Word pieces are matched with LinMaxMatch from `Fast WordPiece
+    Tokenization` (Song et al., 2021), which walks a trie of the vocabulary
+    with precomputed failure links, so that each word is tokenized in linear
+    time rather than by repeated longest-prefix lookups."""
 
     def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=200):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
 
+        # The trie is built lazily and rebuilt once the vocabulary grows.
+        self._trie_size = -1
+
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
         NOTE(geyingli): we do not create `unk_token` in this step."""
 
         text = convert_to_unicode(text)
+        if self._trie_size != len(self.vocab):
+            self._build_trie()
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
+            if len(token) > self.max_input_chars_per_word:
                 # output_tokens.append(self.unk_token)
                 output_tokens.append(token)
                 continue
 
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
+            # Words that fail LinMaxMatch are rare (OOV, or literally
+            # starting with "##"), so re-check them with the original
+            # greedy algorithm to keep the results identical.
+            sub_tokens = self._lin_max_match(token)
+            if sub_tokens is None:
+                sub_tokens = self._max_match(token)
 
-            if is_bad:
+            if sub_tokens is None:
                 # output_tokens.append(self.unk_token)
                 output_tokens.append(token)
             else:
                 output_tokens.extend(sub_tokens)
         return output_tokens
 
+    def _build_trie(self):
+        """Builds the vocabulary trie with failure links and failure pops."""
+        children = [{}]
+        strings = [""]
+
+        def insert(string):
+            node = 0
+            for char in string:
+                child = children[node].get(char)
+                if child is None:
+                    child = len(children)
+                    children[node][char] = child
+                    children.append({})
+                    strings.append(strings[node] + char)
+                node = child
+            return node
+
+        for piece in self.vocab:
+            insert(piece)
+        suffix_root = insert("##")
+
+        # Failure links are computed in breadth-first order, with the root
+        # and the suffix root ("##") both regarded as depth 0, so that the
+        # links of shallower nodes are always ready when they are followed.
+        fail = [-1] * len(children)
+        pops = [()] * len(children)
+        queue = collections.deque([0, suffix_root])
+        while queue:
+            node = queue.popleft()
+            for char, child in children[node].items():
+                if child == suffix_root:
+                    continue
+                queue.append(child)
+
+                if strings[child] in self.vocab:
+                    fail[child] = suffix_root
+                    pops[child] = (strings[child],)
+                    continue
+
+                link = fail[node]
+                link_pops = pops[node]
+                while link != -1 and char not in children[link]:
+                    link_pops += pops[link]
+                    link = fail[link]
+                if link != -1:
+                    fail[child] = children[link][char]
+                    pops[child] = link_pops
+
+        self._trie_children = children
+        self._trie_fail = fail
+        self._trie_pops = pops
+        self._trie_suffix_root = suffix_root
+        self._trie_size = len(self.vocab)
+
+    def _lin_max_match(self, token):
+        """Matches word pieces in one pass. Returns None on failure."""
+        children = self._trie_children
+        fail = self._trie_fail
+        pops = self._trie_pops
+
+        sub_tokens = []
+        node = 0
+        for char in token:
+            child = children[node].get(char)
+            while child is None:
+                if fail[node] == -1:
+                    return None
+                sub_tokens.extend(pops[node])
+                node = fail[node]
+                child = children[node].get(char)
+            node = child
+
+        while node != self._trie_suffix_root:
+            if fail[node] == -1:
+                return None
+            sub_tokens.extend(pops[node])
+            node = fail[node]
+        return sub_tokens or None
+
+    def _max_match(self, token):
+        """Greedy longest-match-first. Returns None on failure."""
+        chars = list(token)
+        start = 0
+        sub_tokens = []
+        while start < len(chars):
+            end = len(chars)
+            cur_substr = None
+            while start < end:
+                substr = "".join(chars[start:end])
+                if start > 0:
+                    substr = "##" + substr
+                if substr in self.vocab:
+                    cur_substr = substr
+                    break
+                end -= 1
+            if cur_substr is None:
+                return None
+            sub_tokens.append(cur_substr)
+            start = end
+        return sub_tokens
+
 
 def convert_to_unicode(text):
     """Converts `text` to Unicode (if it's not already), assuming